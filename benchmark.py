@@ -0,0 +1,100 @@
+"""
+JalRakshak - Processing Resolution Benchmark
+============================================
+Runs roof detection and segmentation on one screenshot at every processing
+preset and reports latency, peak memory and area error against 'full'.
+
+Usage:
+    python benchmark.py screenshot.png --camera-alt 232 [--repeats 3]
+"""
+
+import argparse
+import time
+
+import cv2
+import torch
+
+from ml import Config, load_models, resize_for_processing, detect_and_segment_roofs
+from loadtest import RssSampler
+
+
+def run_preset(image, yolo_model, sam_predictor, meters_per_pixel: float, preset: str):
+    """Resize and segment once at one preset"""
+    proc_image, scale = resize_for_processing(image, Config.PROCESSING_PRESETS[preset])
+    roofs, _ = detect_and_segment_roofs(proc_image, yolo_model, sam_predictor,
+                                        meters_per_pixel / scale)
+    return proc_image, roofs
+
+
+def benchmark_preset(image, yolo_model, sam_predictor, camera_alt: float,
+                     preset: str, repeats: int) -> dict:
+    """Time one preset, then measure its peak host/GPU memory in a separate pass
+
+    Memory is taken from resident set size, which includes torch's CPU
+    allocator, and is sampled outside the timed runs so it adds no overhead.
+    """
+    meters_per_pixel = camera_alt / image.shape[0]
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        proc_image, roofs = run_preset(image, yolo_model, sam_predictor, meters_per_pixel, preset)
+        latencies.append(time.perf_counter() - start)
+
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    baseline_kb = RssSampler.current_kb()
+    with RssSampler() as rss:
+        run_preset(image, yolo_model, sam_predictor, meters_per_pixel, preset)
+    peak_gpu = torch.cuda.max_memory_allocated() if torch.cuda.is_available() else 0
+
+    return {
+        'preset': preset,
+        'size': f"{proc_image.shape[1]}x{proc_image.shape[0]}",
+        'latency_s': min(latencies),
+        'peak_rss_mb': rss.peak_kb / 1024,
+        'rss_growth_mb': max(0, rss.peak_kb - baseline_kb) / 1024,
+        'peak_gpu_mb': peak_gpu / 2**20,
+        'roofs': len(roofs),
+        'total_area_m2': sum(r['area_m2'] for r in roofs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image', help="Google Earth screenshot")
+    parser.add_argument('--camera-alt', type=float, default=232.0,
+                        help="Camera altitude in meters (default: 232)")
+    parser.add_argument('--repeats', type=int, default=3,
+                        help="Runs per preset; the fastest is reported (default: 3)")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image, cv2.IMREAD_COLOR)
+    if image is None:
+        parser.error(f"Could not read image: {args.image}")
+
+    yolo_model, sam_predictor = load_models()
+    if yolo_model is None or sam_predictor is None:
+        parser.error("Models not loaded. Check installation.")
+
+    # Warm up so model initialisation is not billed to the first preset
+    warmup_image, _ = resize_for_processing(image, 320)
+    detect_and_segment_roofs(warmup_image, yolo_model, sam_predictor, 1.0)
+
+    rows = [benchmark_preset(image, yolo_model, sam_predictor, args.camera_alt,
+                             preset, args.repeats)
+            for preset in Config.PROCESSING_PRESETS]
+    reference = next(r for r in rows if r['preset'] == 'full')['total_area_m2']
+
+    print(f"{'preset':<10}{'size':>12}{'latency s':>11}{'RSS MB':>9}{'+RSS MB':>9}"
+          f"{'gpu MB':>9}{'roofs':>7}{'area m²':>11}{'area err':>10}")
+    for r in rows:
+        error = (r['total_area_m2'] - reference) / reference * 100 if reference else 0.0
+        print(f"{r['preset']:<10}{r['size']:>12}{r['latency_s']:>11.2f}"
+              f"{r['peak_rss_mb']:>9.0f}{r['rss_growth_mb']:>9.0f}{r['peak_gpu_mb']:>9.1f}"
+              f"{r['roofs']:>7}{r['total_area_m2']:>11.1f}{error:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
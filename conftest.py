@@ -0,0 +1 @@
+# Makes the top-level ml.py / loadtest.py modules importable from tests/
@@ -0,0 +1,438 @@
+"""
+JalRakshak - End-to-End Load Test
+=================================
+Simulates N concurrent sessions running the full analysis pipeline
+(OCR -> detection/segmentation -> precipitation -> harvest calculation)
+against synthetic Google Earth screenshots and a local Open-Meteo stand-in,
+so no real screenshots or network access are needed.
+
+For every concurrency level it reports throughput, tail latency, peak RSS
+and ground-truth area error, and marks the level where the server saturates
+on throughput, latency or memory.
+
+Usage:
+    python loadtest.py --sessions 1 2 4 8 --requests 16
+    python loadtest.py --api-latency 0.5 --api-failure-rate 0.2 --skip-inference
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from ml import (
+    Config,
+    calculate_harvestable_water,
+    detect_and_segment_roofs,
+    extract_coordinates_ocr,
+    fetch_precipitation,
+    load_models,
+    resize_for_processing,
+    submit_stage,
+)
+
+
+# ==================== SYNTHETIC SCREENSHOTS ====================
+
+def make_synthetic_screenshot(width: int = 1600, height: int = 900, n_roofs: int = 8,
+                              lat: float = 28.704100, lon: float = 77.102500,
+                              eye_alt: float = 232.0, seed: int = 0) -> Tuple[np.ndarray, Dict]:
+    """Render a fake aerial screenshot with known roof areas
+
+    Roofs are drawn as rotated rectangles on a noisy ground texture and the
+    bottom-right corner carries the coordinate / "Eye alt" overlay that
+    extract_coordinates_ocr() crops and parse_coordinates() expects.
+    """
+    rng = np.random.default_rng(seed)
+    meters_per_pixel = eye_alt / height
+
+    ground = rng.normal(90, 12, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    ground = cv2.GaussianBlur(ground, (7, 7), 0)
+    image = ground.copy()
+
+    # Keep roofs out of the OCR crop (bottom 18% of the image); a rotated
+    # roof can reach its half-diagonal from the centre in any direction
+    max_y = int(height * 0.80)
+    roofs = []
+    for i in range(n_roofs):
+        w_px = int(rng.integers(40, 160))
+        h_px = int(rng.integers(40, 160))
+        reach = math.ceil(math.hypot(w_px, h_px) / 2) + 2
+        cx = int(rng.integers(reach, width - reach))
+        cy = int(rng.integers(reach, max_y - reach))
+        angle = float(rng.uniform(0, 90))
+
+        corners = cv2.boxPoints(((cx, cy), (w_px, h_px), angle)).astype(np.int32)
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [corners], 1)
+        # Later roofs may overlap earlier ones; only count visible pixels
+        for roof in roofs:
+            roof['mask'][mask.astype(bool)] = 0
+
+        color = rng.integers(120, 230, 3).tolist()
+        cv2.fillPoly(image, [corners], color)
+        cv2.polylines(image, [corners], True, (40, 40, 40), 2)
+        roofs.append({'id': i + 1, 'mask': mask})
+
+    for roof in roofs:
+        pixels = int(roof.pop('mask').sum())
+        roof['pixels'] = pixels
+        roof['area_m2'] = pixels * meters_per_pixel ** 2
+
+    # Google Earth style status bar
+    text = f"{lat:.6f}, {lon:.6f}  Eye alt {eye_alt:.0f} m"
+    scale = height / 900
+    x0, y0 = int(width * 0.58), int(height * 0.90)
+    (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.7 * scale, 2)
+    cv2.rectangle(image, (x0 - 10, y0 - th - 10), (x0 + tw + 10, y0 + 10), (20, 20, 20), -1)
+    cv2.putText(image, text, (x0, y0), cv2.FONT_HERSHEY_SIMPLEX, 0.7 * scale,
+                (255, 255, 255), 2, cv2.LINE_AA)
+
+    truth = {
+        'latitude': lat,
+        'longitude': lon,
+        'eye_alt_m': eye_alt,
+        'meters_per_pixel': meters_per_pixel,
+        'roofs': roofs,
+        'total_area_m2': sum(r['area_m2'] for r in roofs),
+    }
+    return image, truth
+
+
+# ==================== FAKE OPEN-METEO ====================
+
+class FakeOpenMeteo:
+    """Local Open-Meteo stand-in with configurable latency and failures
+
+    Serves /v1/archive and /v1/forecast with deterministic daily
+    precipitation (monsoon-weighted) for any coordinate. Failed requests
+    either return HTTP 500 or stall past the client timeout.
+    """
+
+    # Relative monthly rainfall, Indian monsoon shape (Jan..Dec)
+    MONTHLY_WEIGHTS = [0.2, 0.2, 0.2, 0.3, 0.5, 1.5, 4.0, 3.8, 2.0, 0.5, 0.2, 0.2]
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, stall_rate: float = 0.0,
+                 annual_mm: float = 800.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.annual_mm = annual_mm
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.requests = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'FakeOpenMeteo':
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def daily_precipitation(self, lat: float, lon: float, days: List[date]) -> List[float]:
+        """Deterministic per-day rainfall so repeated fetches agree"""
+        mean_weight = sum(self.MONTHLY_WEIGHTS) / 12
+        values = []
+        for day in days:
+            rng = random.Random(f"{lat:.4f}:{lon:.4f}:{day.isoformat()}")
+            expected = self.annual_mm / 365 * self.MONTHLY_WEIGHTS[day.month - 1] / mean_weight
+            # Roughly 40% wet days, gamma-distributed amounts
+            values.append(round(rng.gammavariate(0.6, expected / 0.24), 1)
+                          if rng.random() < 0.4 else 0.0)
+        return values
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        with self.rng_lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            roll = self.rng.random()
+
+        if roll < self.stall_rate:
+            time.sleep(Config.API_TIMEOUT + 1)
+            return
+        time.sleep(delay)
+        if roll < self.stall_rate + self.failure_rate:
+            request.send_error(500, "Injected failure")
+            return
+
+        url = urlparse(request.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        lat = float(query.get('latitude', 0))
+        lon = float(query.get('longitude', 0))
+
+        if url.path.endswith('/archive'):
+            start = date.fromisoformat(query['start_date'])
+            end = date.fromisoformat(query['end_date'])
+        else:
+            end = date.today() + timedelta(days=6)
+            start = date.today() - timedelta(days=int(query.get('past_days', 0)))
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+        body = json.dumps({
+            'latitude': lat,
+            'longitude': lon,
+            'daily': {
+                'time': [d.isoformat() for d in days],
+                'precipitation_sum': self.daily_precipitation(lat, lon, days),
+            },
+        }).encode()
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+# ==================== LOAD DRIVER ====================
+
+class RssSampler:
+    """Track peak resident set size while a load level runs"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_kb() -> int:
+        try:
+            with open('/proc/self/status') as f:
+                match = re.search(r'VmRSS:\s+(\d+)', f.read())
+                return int(match.group(1)) if match else 0
+        except OSError:
+            # Non-Linux: fall back to the lifetime peak
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, self.current_kb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> 'RssSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_session(image: np.ndarray, truth: Dict, models, skip_inference: bool) -> Dict:
+    """One user request through the same stages as the Calculate button"""
+    timings = {}
+
+    start = time.perf_counter()
+    lat, lon, alt, _ = extract_coordinates_ocr(image)
+    timings['ocr'] = time.perf_counter() - start
+    ocr_ok = lat is not None and lon is not None and alt is not None
+    if not ocr_ok:
+        lat, lon, alt = truth['latitude'], truth['longitude'], truth['eye_alt_m']
+
+    # Precipitation overlaps inference, as in the app
+    precip_start = time.perf_counter()
+    precip_future = submit_stage('network', fetch_precipitation, lat, lon, lambda level, message: None)
+
+    area_m2 = truth['total_area_m2']
+    if not skip_inference:
+        stage = time.perf_counter()
+        meters_per_pixel = alt / image.shape[0]
+        proc_image, scale = resize_for_processing(
+            image, Config.PROCESSING_PRESETS[Config.PROCESSING_PRESET])
+        roofs, _ = detect_and_segment_roofs(proc_image, *models, meters_per_pixel / scale)
+        area_m2 = sum(r['area_m2'] for r in roofs)
+        timings['inference'] = time.perf_counter() - stage
+
+    precip_mm, api_data = precip_future.result()
+    timings['precipitation'] = time.perf_counter() - precip_start
+
+    calculate_harvestable_water(area_m2, precip_mm)
+    timings['total'] = time.perf_counter() - start
+
+    return {
+        'timings': timings,
+        'ocr_ok': ocr_ok,
+        'precip_fallback': api_data.get('source') == 'fallback',
+        # Undefined for screenshots without roofs
+        'area_error': ((area_m2 - truth['total_area_m2']) / truth['total_area_m2']
+                       if truth['total_area_m2'] > 0 else None),
+    }
+
+
+def run_level(sessions: int, n_requests: int, workload: List[Tuple[np.ndarray, Dict]],
+              models, skip_inference: bool) -> Dict:
+    """Run n_requests with `sessions` concurrent workers and summarise"""
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=sessions) as pool:
+        start = time.perf_counter()
+        futures = [pool.submit(run_session, *workload[i % len(workload)], models, skip_inference)
+                   for i in range(n_requests)]
+        results = [f.result() for f in futures]
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array([r['timings']['total'] for r in results])
+    area_errors = [abs(r['area_error']) for r in results if r['area_error'] is not None]
+    return {
+        'sessions': sessions,
+        'throughput_rps': n_requests / elapsed,
+        'p50_s': float(np.percentile(latencies, 50)),
+        'p95_s': float(np.percentile(latencies, 95)),
+        'p99_s': float(np.percentile(latencies, 99)),
+        'peak_rss_mb': rss.peak_kb / 1024,
+        'ocr_ok': sum(r['ocr_ok'] for r in results) / len(results),
+        'precip_fallback': sum(r['precip_fallback'] for r in results) / len(results),
+        'mean_abs_area_error': float(np.mean(area_errors)) if area_errors else float('nan'),
+    }
+
+
+def system_memory_mb() -> Optional[float]:
+    """Total physical memory, or None where /proc/meminfo is unavailable"""
+    try:
+        with open('/proc/meminfo') as f:
+            match = re.search(r'MemTotal:\s+(\d+)', f.read())
+            return int(match.group(1)) / 1024 if match else None
+    except OSError:
+        return None
+
+
+def find_saturation(rows: List[Dict], memory_limit_mb: Optional[float] = None,
+                    min_gain: float = 1.10,
+                    max_p95_ratio: float = 2.0) -> Optional[Tuple[Dict, str]]:
+    """First level where throughput stops scaling, p95 blows up or memory runs out"""
+    baseline_p95 = rows[0]['p95_s']
+    for prev, row in zip([None] + rows, rows):
+        if memory_limit_mb is not None and row['peak_rss_mb'] > memory_limit_mb:
+            return row, f"peak RSS above {memory_limit_mb:.0f} MB"
+        if prev is None:
+            continue
+        if row['throughput_rps'] < prev['throughput_rps'] * min_gain:
+            return row, "throughput stopped scaling"
+        if row['p95_s'] > baseline_p95 * max_p95_ratio:
+            return row, f"p95 latency above {max_p95_ratio:.0f}x the first level"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="Concurrency levels to test (default: 1 2 4 8)")
+    parser.add_argument('--requests', type=int, default=16,
+                        help="Requests per concurrency level (default: 16)")
+    parser.add_argument('--images', type=int, default=4,
+                        help="Distinct synthetic screenshots (default: 4)")
+    parser.add_argument('--roofs', type=int, default=8,
+                        help="Roofs per screenshot (default: 8)")
+    parser.add_argument('--api-latency', type=float, default=0.2,
+                        help="Fake Open-Meteo mean latency in seconds (default: 0.2)")
+    parser.add_argument('--api-jitter', type=float, default=0.05,
+                        help="Fake Open-Meteo latency jitter in seconds (default: 0.05)")
+    parser.add_argument('--api-failure-rate', type=float, default=0.0,
+                        help="Fraction of API calls answered with HTTP 500 (default: 0)")
+    parser.add_argument('--api-stall-rate', type=float, default=0.0,
+                        help="Fraction of API calls that stall past the timeout (default: 0)")
+    parser.add_argument('--api-timeout', type=float, default=Config.API_TIMEOUT,
+                        help=f"Client timeout in seconds (default: {Config.API_TIMEOUT})")
+    parser.add_argument('--preset', choices=list(Config.PROCESSING_PRESETS),
+                        default=Config.PROCESSING_PRESET, help="Processing resolution preset")
+    memory_mb = system_memory_mb()
+    parser.add_argument('--memory-limit-mb', type=float,
+                        default=memory_mb * 0.9 if memory_mb else None,
+                        help="Peak RSS treated as memory saturation (default: 90%% of RAM)")
+    parser.add_argument('--warm-cache', action='store_true',
+                        help="Keep the rainfall cache across levels (default: cold per level)")
+    parser.add_argument('--skip-inference', action='store_true',
+                        help="Skip YOLO/SAM and use ground-truth areas (OCR + API only)")
+    args = parser.parse_args()
+
+    Config.API_TIMEOUT = args.api_timeout
+    Config.PROCESSING_PRESET = args.preset
+    # Each level starts from an empty rainfall cache unless --warm-cache is set;
+    # otherwise nearly every fetch after the first per location is a cache hit
+    # and the fake API's latency and failure settings have no effect
+    cache_dir = tempfile.TemporaryDirectory()
+
+    models = (None, None)
+    if not args.skip_inference:
+        models = load_models()
+        if models[0] is None or models[1] is None:
+            parser.error("Models not loaded. Check installation or pass --skip-inference.")
+
+    fake = FakeOpenMeteo(latency=args.api_latency, jitter=args.api_jitter,
+                         failure_rate=args.api_failure_rate,
+                         stall_rate=args.api_stall_rate).start()
+    Config.OPEN_METEO_ARCHIVE_URL = f"{fake.base_url}/archive"
+    Config.OPEN_METEO_FORECAST_URL = f"{fake.base_url}/forecast"
+
+    workload = [make_synthetic_screenshot(n_roofs=args.roofs, seed=i,
+                                          lat=28.5 + 0.05 * i, lon=77.0 + 0.05 * i)
+                for i in range(args.images)]
+
+    try:
+        rows = []
+        for level, sessions in enumerate(args.sessions):
+            level_cache = 'warm' if args.warm_cache else f"level-{level}"
+            Config.RAINFALL_CACHE_DIR = Path(cache_dir.name) / level_cache
+            rows.append(run_level(sessions, args.requests, workload, models,
+                                  args.skip_inference))
+    finally:
+        fake.stop()
+        cache_dir.cleanup()
+
+    print(f"{'sessions':>8}{'req/s':>9}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}"
+          f"{'RSS MB':>9}{'OCR ok':>8}{'fallbk':>8}{'area err':>10}")
+    for r in rows:
+        print(f"{r['sessions']:>8}{r['throughput_rps']:>9.2f}{r['p50_s']:>8.2f}"
+              f"{r['p95_s']:>8.2f}{r['p99_s']:>8.2f}{r['peak_rss_mb']:>9.0f}"
+              f"{r['ocr_ok']:>8.0%}{r['precip_fallback']:>8.0%}"
+              f"{r['mean_abs_area_error']:>10.1%}")
+    print(f"\nFake Open-Meteo served {fake.requests} requests")
+
+    saturated = find_saturation(rows, args.memory_limit_mb)
+    if saturated:
+        row, reason = saturated
+        print(f"Saturation at {row['sessions']} concurrent sessions: {reason} "
+              f"({row['throughput_rps']:.2f} req/s, p95 {row['p95_s']:.2f} s, "
+              f"RSS {row['peak_rss_mb']:.0f} MB)")
+    else:
+        print("No saturation within the tested concurrency levels")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,18 +15,45 @@ import requests
 import json
 from pathlib import Path
 from datetime import date, timedelta
-from typing import Tuple, List, Optional, Dict
+from typing import Tuple, List, Optional, Dict, Iterator, Callable
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, Future
 import base64
 from io import BytesIO
 from PIL import Image
 import warnings
+import cProfile
+import contextlib
+import hashlib
+import shutil
+import zipfile
+import logging
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
 warnings.filterwarnings('ignore')
 import streamlit as st
 import urllib.request
 from pathlib import Path
 import os
 
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
+# Streamlit runs this file as __main__ and leaves logging unconfigured, so the
+# app logger gets its own handler to make INFO messages (box triage) visible
+logger = logging.getLogger('jalrakshak')
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
 # Optional imports with fallbacks
 try:
     import pytesseract
@@ -145,9 +172,83 @@ class Config:
     RUNOFF_COEFFICIENT = 0.80
     MIN_ROOF_AREA = 20.0
     
+    # Box triage before SAM. ROOF_CLASS_NAMES is an allow-list for roof-trained
+    # weights (None = any class). With stock COCO weights, which have no roof
+    # class, only COCO_NON_ROOF_CLASS_NAMES are dropped: objects seen from
+    # above that can never be a roof. Other weights are left unfiltered.
+    ROOF_CLASS_NAMES = None
+    COCO_NON_ROOF_CLASS_NAMES = {
+        'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat',
+        'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench',
+        'bird', 'cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe',
+    }
+    # Optional TorchScript roof/non-roof classifier on 64x64 RGB patches
+    ROOF_PATCH_CLASSIFIER = "weights/roof_patch_classifier.pt"
+    ROOF_PATCH_SIZE = 64
+    ROOF_PATCH_THRESHOLD = 0.5
+    
+    # Processing resolution: longest image side in pixels (None = native).
+    # YOLO and SAM resize internally, so detection runs on a downscaled copy.
+    PROCESSING_PRESETS = {
+        'fast': 640,
+        'balanced': 1280,
+        'full': None,
+    }
+    PROCESSING_PRESET = 'balanced'
+    
+    # Live overlay redraws during segmentation are at least this many seconds
+    # apart (each redraw re-encodes the full frame)
+    OVERLAY_REFRESH_INTERVAL = 0.5
+    
     # API parameters
     API_TIMEOUT = 30
-    HISTORICAL_DAYS = 365
+    RAINFALL_YEARS = 10  # Years of daily history used for rainfall statistics
+    RAINFALL_FETCH_WORKERS = 4
+    RAINFALL_CACHE_DIR = Path(os.environ.get('JALRAKSHAK_RAINFALL_CACHE', "cache/rainfall"))
+    ARCHIVE_LAG_DAYS = 5  # The archive API trails real time by a few days
+    
+    # Background pipeline stages run on per-kind pools shared by every session
+    # in the server process, so a slow model load cannot starve network calls
+    STAGE_WORKERS = {
+        'models': 2,    # load_models() (cached; later calls return at once)
+        'network': 16,  # precipitation lookups
+    }
+    
+    # Profiling (opt-in per request; also ?profile=1 or JALRAKSHAK_PROFILE=1)
+    PROFILE_DEFAULT = os.environ.get('JALRAKSHAK_PROFILE', '').lower() in ('1', 'true', 'yes')
+    PROFILE_DIR = Path(os.environ.get('JALRAKSHAK_PROFILE_DIR', "profiles"))
+    PROFILE_SAMPLE_INTERVAL = 0.01  # Seconds between stack samples
+    PROFILE_MAX_SAMPLES = 20000  # Sampling stops after this many stacks
+    PROFILE_KEEP_RUNS = 20  # Older profile directories are deleted
+    PROFILE_MAX_TOTAL_MB = 500  # ...as are any beyond this total size
+    OPEN_METEO_ARCHIVE_URL = os.environ.get(
+        'OPEN_METEO_ARCHIVE_URL', "https://archive-api.open-meteo.com/v1/archive")
+    OPEN_METEO_FORECAST_URL = os.environ.get(
+        'OPEN_METEO_FORECAST_URL', "https://api.open-meteo.com/v1/forecast")
+
+
+@st.cache_resource(show_spinner=False)
+def _stage_pool(kind: str) -> ThreadPoolExecutor:
+    """Stage pool for one kind, created once per process (Streamlit re-executes this module)"""
+    return ThreadPoolExecutor(max_workers=Config.STAGE_WORKERS[kind],
+                              thread_name_prefix=f'jalrakshak-{kind}')
+
+
+def submit_stage(kind: str, fn: Callable, *args, **kwargs) -> Future:
+    """Run a pipeline stage on the `kind` pool, keeping the Streamlit context"""
+    ctx = get_script_run_ctx() if get_script_run_ctx is not None else None
+    
+    def run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    
+    return _stage_pool(kind).submit(run)
+
+
+def _st_notify(level: str, message: str):
+    """Show a status message with st.info / st.success / st.warning"""
+    getattr(st, level)(message)
 
 
 # ==================== UTILITY FUNCTIONS ====================
@@ -200,25 +301,198 @@ def parse_coordinates(text: str) -> Tuple[Optional[float], Optional[float], Opti
     return lat, lon, alt
 
 
-def fetch_precipitation(lat: float, lon: float) -> Tuple[Optional[float], Dict]:
-    """Fetch annual precipitation from Open-Meteo API"""
-    end_date = date.today()
-    start_date = end_date - timedelta(days=Config.HISTORICAL_DAYS)
+def _rainfall_cache_path(lat: float, lon: float) -> Path:
+    """Cache file for a location, rounded to roughly the archive grid"""
+    return Config.RAINFALL_CACHE_DIR / f"{lat:.2f}_{lon:.2f}.npz"
+
+
+def load_rainfall_cache(lat: float, lon: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Load cached daily rainfall as (dates, precip_mm) columns"""
+    path = _rainfall_cache_path(lat, lon)
+    try:
+        with np.load(path) as cache:
+            return cache['dates'].astype('datetime64[D]'), cache['precip_mm']
+    except (OSError, KeyError, ValueError):
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float32)
+
+
+def save_rainfall_cache(lat: float, lon: float, dates: np.ndarray, precip: np.ndarray):
+    """Write the daily rainfall columns atomically"""
+    path = _rainfall_cache_path(lat, lon)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.npz', delete=False) as f:
+        np.savez(f, dates=dates, precip_mm=precip)
+    os.replace(f.name, path)
+
+
+def fetch_archive_chunk(lat: float, lon: float, start_date: date,
+                        end_date: date) -> Tuple[np.ndarray, np.ndarray]:
+    """Fetch one date range of daily rainfall from the archive API"""
+    url = (
+        f"{Config.OPEN_METEO_ARCHIVE_URL}"
+        f"?latitude={lat}&longitude={lon}"
+        f"&start_date={start_date.isoformat()}"
+        f"&end_date={end_date.isoformat()}"
+        "&daily=precipitation_sum"
+        "&timezone=UTC"
+    )
+    response = requests.get(
+        url,
+        timeout=Config.API_TIMEOUT,
+        headers={
+            'User-Agent': 'JalRakshak/1.0',
+            'Accept': 'application/json'
+        }
+    )
+    response.raise_for_status()
+    daily = response.json().get('daily', {})
+    
+    dates = np.array(daily.get('time', []), dtype='datetime64[D]')
+    precip = np.array([np.nan if v is None else v for v in daily.get('precipitation_sum', [])],
+                      dtype=np.float32)
+    return dates, precip
+
+
+def _year_chunks(start_date: date, end_date: date) -> List[Tuple[date, date]]:
+    """Split a date range at calendar-year boundaries"""
+    chunks = []
+    while start_date <= end_date:
+        chunk_end = min(date(start_date.year, 12, 31), end_date)
+        chunks.append((start_date, chunk_end))
+        start_date = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def _missing_spans(dates: np.ndarray, start_date: date, end_date: date) -> List[Tuple[date, date]]:
+    """Contiguous date ranges in [start_date, end_date] not present in dates"""
+    days = np.arange(np.datetime64(start_date), np.datetime64(end_date) + 1)
+    missing = np.concatenate([[False], ~np.isin(days, dates), [False]]).astype(np.int8)
+    edges = np.diff(missing)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return [(days[a].item(), days[b].item()) for a, b in zip(starts, ends)]
+
+
+def fetch_rainfall_history(lat: float, lon: float,
+                           years: Optional[int] = None
+                           ) -> Tuple[np.ndarray, np.ndarray, List[Exception]]:
+    """Daily rainfall for the last `years` calendar years plus the current one
+
+    Only days missing from the local cache are requested; they are fetched as
+    year chunks in parallel and merged back into the cache. A failed chunk
+    does not discard the others: whatever was fetched is cached and returned,
+    together with the errors of the chunks that failed.
+    """
+    years = Config.RAINFALL_YEARS if years is None else years
+    end_date = date.today() - timedelta(days=Config.ARCHIVE_LAG_DAYS)
+    start_date = date(end_date.year - years, 1, 1)
+    
+    dates, precip = load_rainfall_cache(lat, lon)
+    
+    chunks = [chunk for span in _missing_spans(dates, start_date, end_date)
+              for chunk in _year_chunks(*span)]
+    errors = []
+    if chunks:
+        with ThreadPoolExecutor(max_workers=Config.RAINFALL_FETCH_WORKERS) as pool:
+            futures = [pool.submit(fetch_archive_chunk, lat, lon, *chunk) for chunk in chunks]
+        
+        fetched = []
+        for future in futures:
+            try:
+                fetched.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        
+        if fetched:
+            dates = np.concatenate([dates] + [d for d, _ in fetched])
+            precip = np.concatenate([precip] + [p for _, p in fetched])
+            dates, index = np.unique(dates, return_index=True)
+            precip = precip[index]
+            
+            # Drop trailing days the archive has not filled yet so they are refetched
+            valid = np.flatnonzero(~np.isnan(precip))
+            if len(valid) > 0:
+                dates, precip = dates[:valid[-1] + 1], precip[:valid[-1] + 1]
+                save_rainfall_cache(lat, lon, dates, precip)
+    
+    in_range = (dates >= np.datetime64(start_date)) & (dates <= np.datetime64(end_date))
+    return dates[in_range], precip[in_range], errors
+
+
+def rainfall_statistics(dates: np.ndarray, precip: np.ndarray,
+                        min_coverage: float = 0.95) -> Optional[Dict]:
+    """Dependable-rainfall statistics over complete calendar years
+
+    Dependable rainfall at 75% / 90% is the annual total exceeded in that
+    share of years, i.e. the 25th / 10th percentile of annual totals.
+    Returns None when no year has enough valid days.
+    """
+    if len(dates) == 0:
+        return None
     
-    # Try multiple API endpoints
+    year = dates.astype('datetime64[Y]').astype(int) + 1970
+    month = dates.astype('datetime64[M]').astype(int) % 12
+    valid = ~np.isnan(precip)
+    rain = np.where(valid, precip, 0.0)
+    
+    first_year = year.min()
+    year_idx = year - first_year
+    n_years = year_idx.max() + 1
+    
+    valid_days = np.bincount(year_idx, weights=valid, minlength=n_years)
+    annual = np.bincount(year_idx, weights=rain, minlength=n_years)
+    monthly = np.bincount(year_idx * 12 + month, weights=rain,
+                          minlength=n_years * 12).reshape(n_years, 12)
+    
+    complete = valid_days >= 365 * min_coverage
+    if not complete.any():
+        return None
+    
+    annual = annual[complete]
+    monthly = monthly[complete]
+    
+    return {
+        'years': (np.arange(n_years)[complete] + first_year).tolist(),
+        'annual_totals_mm': annual.tolist(),
+        'mean_annual_mm': float(annual.mean()),
+        'dependable_75_mm': float(np.percentile(annual, 25)),
+        'dependable_90_mm': float(np.percentile(annual, 10)),
+        'monthly_mean_mm': monthly.mean(axis=0).tolist(),
+    }
+
+
+def fetch_precipitation(lat: float, lon: float,
+                        notify: Callable[[str, str], None] = _st_notify) -> Tuple[Optional[float], Dict]:
+    """Fetch annual precipitation from Open-Meteo API
+
+    Status messages go through notify(level, message); background callers
+    pass a collector and replay the messages on the script thread.
+    """
+    # Primary: multi-year archive history (cached locally)
+    try:
+        notify('info', f"Fetching {Config.RAINFALL_YEARS} years of precipitation history...")
+        dates, precip, errors = fetch_rainfall_history(lat, lon)
+        stats = rainfall_statistics(dates, precip)
+        if stats is not None:
+            if errors:
+                notify('warning', f"⚠️ {len(errors)} archive request(s) failed "
+                                  f"({errors[0]}); using the years available")
+            notify('success', f"✅ Precipitation data fetched successfully "
+                              f"({len(stats['years'])} complete years)!")
+            return stats['mean_annual_mm'], {'source': 'archive', 'statistics': stats}
+        if errors:
+            raise errors[0]
+    except requests.exceptions.Timeout:
+        notify('warning', "⏱️ Archive request timed out, trying next option...")
+    except requests.exceptions.ConnectionError:
+        notify('warning', "🌐 Connection error fetching archive, trying next option...")
+    except Exception as e:
+        notify('warning', f"❌ Archive history failed: {str(e)}")
+    
+    # Backup: recent history from the forecast API
     urls = [
-        # Primary: Archive API
         (
-            "https://archive-api.open-meteo.com/v1/archive"
-            f"?latitude={lat}&longitude={lon}"
-            f"&start_date={start_date.isoformat()}"
-            f"&end_date={end_date.isoformat()}"
-            "&daily=precipitation_sum"
-            "&timezone=UTC"
-        ),
-        # Backup: Historical Weather API
-        (
-            "https://api.open-meteo.com/v1/forecast"
+            f"{Config.OPEN_METEO_FORECAST_URL}"
             f"?latitude={lat}&longitude={lon}"
             "&daily=precipitation_sum"
             "&past_days=92"  # Last 3 months
@@ -228,7 +502,7 @@ def fetch_precipitation(lat: float, lon: float) -> Tuple[Optional[float], Dict]:
     
     for i, url in enumerate(urls):
         try:
-            st.info(f"Attempting to fetch precipitation data (attempt {i+1}/{len(urls)})...")
+            notify('info', f"Attempting to fetch precipitation data (attempt {i+1}/{len(urls)})...")
             
             response = requests.get(
                 url, 
@@ -252,21 +526,21 @@ def fetch_precipitation(lat: float, lon: float) -> Tuple[Optional[float], Dict]:
                     if len(valid_values) < 300:  # Less than full year
                         total_mm = total_mm * (365 / len(valid_values))
                     
-                    st.success(f"✅ Precipitation data fetched successfully!")
+                    notify('success', f"✅ Precipitation data fetched successfully!")
                     return total_mm, data
                     
         except requests.exceptions.Timeout:
-            st.warning(f"⏱️ Request {i+1} timed out, trying next option...")
+            notify('warning', f"⏱️ Request {i+1} timed out, trying next option...")
             continue
         except requests.exceptions.ConnectionError:
-            st.warning(f"🌐 Connection error on attempt {i+1}, trying next option...")
+            notify('warning', f"🌐 Connection error on attempt {i+1}, trying next option...")
             continue
         except Exception as e:
-            st.warning(f"❌ Attempt {i+1} failed: {str(e)}")
+            notify('warning', f"❌ Attempt {i+1} failed: {str(e)}")
             continue
     
     # If all attempts failed, use fallback data
-    st.warning("⚠️ Could not fetch live data. Using average rainfall estimates.")
+    notify('warning', "⚠️ Could not fetch live data. Using average rainfall estimates.")
     
     # Fallback: Use approximate rainfall data for major Indian cities
     fallback_data = {
@@ -291,8 +565,13 @@ def fetch_precipitation(lat: float, lon: float) -> Tuple[Optional[float], Dict]:
 
 
 def calculate_harvestable_water(area_m2: float, precip_mm: float, 
-                                runoff: float = Config.RUNOFF_COEFFICIENT) -> Dict:
-    """Calculate harvestable water volume"""
+                                runoff: float = Config.RUNOFF_COEFFICIENT,
+                                rainfall_stats: Optional[Dict] = None) -> Dict:
+    """Calculate harvestable water volume
+
+    With multi-year rainfall_stats, also reports dependable (75% / 90% of
+    years) yield and the average monthly harvest profile.
+    """
     precip_m = precip_mm / 1000.0
     harvestable_m3 = area_m2 * precip_m * runoff
     harvestable_liters = harvestable_m3 * 1000
@@ -306,7 +585,7 @@ def calculate_harvestable_water(area_m2: float, precip_mm: float,
     
     annual_savings = (harvestable_liters / 1000) * water_cost_per_1000l
     
-    return {
+    results = {
         'total_area_m2': area_m2,
         'annual_precip_mm': precip_mm,
         'annual_precip_m': precip_m,
@@ -316,9 +595,42 @@ def calculate_harvestable_water(area_m2: float, precip_mm: float,
         'days_supply': days_supply,
         'annual_savings_inr': annual_savings
     }
+    
+    if rainfall_stats is not None:
+        # 1 mm of rain on 1 m² yields 1 liter
+        liters_per_mm = area_m2 * runoff
+        monthly_mm = np.asarray(rainfall_stats['monthly_mean_mm'])
+        results.update({
+            'rainfall_years': len(rainfall_stats['years']),
+            'dependable_75_precip_mm': rainfall_stats['dependable_75_mm'],
+            'dependable_90_precip_mm': rainfall_stats['dependable_90_mm'],
+            'dependable_75_liters': rainfall_stats['dependable_75_mm'] * liters_per_mm,
+            'dependable_90_liters': rainfall_stats['dependable_90_mm'] * liters_per_mm,
+            'monthly_harvest_liters': (monthly_mm * liters_per_mm).tolist(),
+        })
+    
+    return results
+
 
+def resize_for_processing(image: np.ndarray, max_side: Optional[int]) -> Tuple[np.ndarray, float]:
+    """Downscale image so its longest side is at most max_side
 
-@st.cache_resource
+    Returns the processing image and its scale factor relative to the input
+    (1.0 when no resize was needed). Divide meters_per_pixel by the scale to
+    get the processing resolution, which keeps mask areas in m² unchanged.
+    """
+    h, w = image.shape[:2]
+    if max_side is None or max(h, w) <= max_side:
+        return image, 1.0
+    
+    new_w = max(1, round(w * max_side / max(h, w)))
+    new_h = max(1, round(h * max_side / max(h, w)))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    
+    return resized, new_h / h
+
+
+@st.cache_resource(show_spinner=False)
 def load_models():
     """Load YOLO and SAM models (cached)"""
     if not YOLO_AVAILABLE or not SAM_AVAILABLE:
@@ -344,69 +656,194 @@ def load_models():
         return None, None
 
 
-def detect_and_segment_roofs(image: np.ndarray, yolo_model, sam_predictor, 
-                             meters_per_pixel: float) -> Tuple[List[Dict], np.ndarray]:
-    """Detect and segment roofs"""
+@st.cache_resource(show_spinner=False)
+def load_patch_classifier():
+    """Load the optional roof/non-roof patch classifier on CPU (cached)"""
+    path = Path(Config.ROOF_PATCH_CLASSIFIER)
+    if not path.exists():
+        return None
+    
+    try:
+        model = torch.jit.load(str(path), map_location='cpu')
+        model.eval()
+        return model
+    except Exception as e:
+        logger.warning("Failed to load patch classifier %s: %s", path, e)
+        return None
+
+
+def _is_coco_model(names: Dict) -> bool:
+    """True for the stock 80-class COCO label set"""
+    return len(names) == 80 and names.get(0) == 'person'
+
+
+def triage_boxes(rgb: np.ndarray, results, meters_per_pixel: float) -> Tuple[np.ndarray, Dict]:
+    """Drop YOLO boxes that can never qualify as roofs before running SAM
+
+    A mask never exceeds its box, so boxes smaller than MIN_ROOF_AREA are
+    skipped outright. rgb is the RGB image also handed to SAM. Returns the
+    kept boxes and per-reason drop counts.
+    """
+    boxes = results.boxes.xyxy.cpu().numpy().astype(int)
+    class_ids = results.boxes.cls.cpu().numpy().astype(int)
+    names = [results.names[c] for c in class_ids]
+    counts = {'detected': len(boxes), 'class': 0, 'area': 0, 'classifier': 0}
+    
+    if Config.ROOF_CLASS_NAMES is not None:
+        class_ok = np.array([n in Config.ROOF_CLASS_NAMES for n in names], dtype=bool)
+    elif _is_coco_model(results.names):
+        class_ok = np.array([n not in Config.COCO_NON_ROOF_CLASS_NAMES for n in names],
+                            dtype=bool)
+    else:
+        class_ok = np.ones(len(boxes), dtype=bool)
+    counts['class'] = int((~class_ok).sum())
+    
+    h, w = rgb.shape[:2]
+    widths = np.clip(boxes[:, 2], 0, w) - np.clip(boxes[:, 0], 0, w)
+    heights = np.clip(boxes[:, 3], 0, h) - np.clip(boxes[:, 1], 0, h)
+    box_area_m2 = widths.clip(0) * heights.clip(0) * meters_per_pixel ** 2
+    area_ok = box_area_m2 >= Config.MIN_ROOF_AREA
+    counts['area'] = int((class_ok & ~area_ok).sum())
+    
+    keep = class_ok & area_ok
+    
+    classifier = load_patch_classifier()
+    if classifier is not None and keep.any():
+        size = Config.ROOF_PATCH_SIZE
+        patches = []
+        for x1, y1, x2, y2 in boxes[keep]:
+            crop = rgb[max(y1, 0):min(y2, h), max(x1, 0):min(x2, w)]
+            patches.append(cv2.resize(crop, (size, size), interpolation=cv2.INTER_AREA))
+        batch = torch.from_numpy(np.stack(patches)).permute(0, 3, 1, 2).float() / 255.0
+        try:
+            with torch.inference_mode():
+                roof_prob = torch.sigmoid(classifier(batch)).flatten().numpy()
+        except Exception as e:
+            # A broken classifier must not block segmentation; keep every box
+            logger.warning("Patch classifier failed, skipping classifier triage: %s", e)
+        else:
+            classifier_ok = roof_prob >= Config.ROOF_PATCH_THRESHOLD
+            counts['classifier'] = int((~classifier_ok).sum())
+            keep[np.flatnonzero(keep)] = classifier_ok
+    
+    counts['kept'] = int(keep.sum())
+    logger.info("Box triage: %d detected, %d kept; dropped %d by class, %d by area, "
+                "%d by classifier (%d SAM calls avoided)",
+                counts['detected'], counts['kept'], counts['class'], counts['area'],
+                counts['classifier'], counts['detected'] - counts['kept'])
+    
+    return boxes[keep], counts
+
+
+@st.cache_resource(show_spinner=False)
+def _sam_lock() -> threading.Lock:
+    """Process-wide lock around the shared, stateful SamPredictor"""
+    return threading.Lock()
+
+
+def iter_roof_segments(image: np.ndarray, yolo_model, sam_predictor,
+                       meters_per_pixel: float) -> Iterator[Dict]:
+    """Detect roofs and yield each segmented roof as soon as it is computed
+
+    The first event is emitted right after YOLO and box triage with ``done=0``
+    and the triage counts, so callers can show the number of candidates before
+    SAM starts. Every following event covers one kept box; ``roof`` is None
+    when the box was filtered out or failed.
+    """
     if yolo_model is None or sam_predictor is None:
-        return [], image
+        return
     
     # Run YOLO detection
     results = yolo_model(image, conf=Config.YOLO_CONF_THRESHOLD, 
                          iou=Config.YOLO_IOU_THRESHOLD, device=Config.DEVICE, 
                          verbose=False)[0]
     
-    boxes = results.boxes.xyxy.cpu().numpy().astype(int)
+    # Converted once; shared by the triage classifier and SAM
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    boxes, triage = triage_boxes(rgb, results, meters_per_pixel)
+    total = len(boxes)
     
-    if len(boxes) == 0:
-        return [], image
+    yield {'done': 0, 'total': total, 'roof': None, 'mask': None, 'color': None,
+           'triage': triage}
     
-    # Segment with SAM
-    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    sam_predictor.set_image(rgb)
+    if total == 0:
+        return
     
+    # Segment with SAM. The cached SamPredictor is shared by every session and
+    # holds the image from set_image(), so the lock is held until this image's
+    # last predict(). It stays held across yields; callers that may stop early
+    # must close the generator (contextlib.closing) to release it.
+    with _sam_lock():
+        sam_predictor.set_image(rgb)
+    
+        num_roofs = 0
+    
+        for i, box in enumerate(boxes):
+            event = {'done': i + 1, 'total': total, 'roof': None, 'mask': None, 'color': None}
+            try:
+                # Get mask
+                mask, score, _ = sam_predictor.predict(box=box.astype(float), 
+                                                       multimask_output=False)
+                mask_bool = mask[0].astype(bool)
+                num_pixels = int(mask_bool.sum())
+                area_m2 = num_pixels * (meters_per_pixel ** 2)
+            
+                # Filter small roofs
+                if area_m2 >= Config.MIN_ROOF_AREA:
+                    num_roofs += 1
+                    event['roof'] = {
+                        'id': num_roofs,
+                        'bbox': box.tolist(),
+                        'area_m2': area_m2,
+                        'pixels': num_pixels
+                    }
+                    event['mask'] = mask_bool
+                    event['color'] = np.random.randint(0, 255, 3).tolist()
+            except Exception as e:
+                st.warning(f"Failed to process roof {i+1}: {e}")
+        
+            yield event
+
+
+def apply_roof_overlay(overlay: np.ndarray, roof: Dict, mask: np.ndarray,
+                       color: List[int]) -> np.ndarray:
+    """Blend one roof mask, box and label into the overlay"""
+    mask_colored = np.zeros_like(overlay)
+    mask_colored[mask] = color
+    overlay = cv2.addWeighted(overlay, 0.7, mask_colored, 0.3, 0)
+    
+    # Draw box and label
+    x1, y1, x2, y2 = roof['bbox']
+    cv2.rectangle(overlay, (x1, y1), (x2, y2), color, 2)
+    label = f"#{roof['id']}: {roof['area_m2']:.1f}m²"
+    cv2.putText(overlay, label, (x1, y1-10), 
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return overlay
+
+
+def detect_and_segment_roofs(image: np.ndarray, yolo_model, sam_predictor, 
+                             meters_per_pixel: float) -> Tuple[List[Dict], np.ndarray]:
+    """Detect and segment roofs"""
     roofs = []
     overlay = image.copy()
     
-    for i, box in enumerate(boxes):
-        try:
-            # Get mask
-            mask, score, _ = sam_predictor.predict(box=box.astype(float), 
-                                                   multimask_output=False)
-            mask_bool = mask[0].astype(bool)
-            num_pixels = int(mask_bool.sum())
-            area_m2 = num_pixels * (meters_per_pixel ** 2)
-            
-            # Filter small roofs
-            if area_m2 < Config.MIN_ROOF_AREA:
-                continue
-            
-            roof_data = {
-                'id': len(roofs) + 1,
-                'bbox': box.tolist(),
-                'area_m2': area_m2,
-                'pixels': num_pixels
-            }
-            roofs.append(roof_data)
-            
-            # Create overlay
-            color = np.random.randint(0, 255, 3).tolist()
-            mask_colored = np.zeros_like(image)
-            mask_colored[mask_bool] = color
-            overlay = cv2.addWeighted(overlay, 0.7, mask_colored, 0.3, 0)
-            
-            # Draw box and label
-            x1, y1, x2, y2 = box
-            cv2.rectangle(overlay, (x1, y1), (x2, y2), color, 2)
-            label = f"#{roof_data['id']}: {area_m2:.1f}m²"
-            cv2.putText(overlay, label, (x1, y1-10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-        except Exception as e:
-            st.warning(f"Failed to process roof {i+1}: {e}")
+    for event in iter_roof_segments(image, yolo_model, sam_predictor, meters_per_pixel):
+        if event['roof'] is None:
             continue
+        roofs.append(event['roof'])
+        overlay = apply_roof_overlay(overlay, event['roof'], event['mask'], event['color'])
+    
+    if not roofs:
+        return [], image
     
     return roofs, overlay
 
 
+def _cancel_segmentation():
+    """Button callback: mark the running segmentation as cancelled"""
+    st.session_state['segmentation_cancelled'] = True
+
+
 def create_download_link(data: Dict, filename: str) -> str:
     """Create download link for JSON data"""
     json_str = json.dumps(data, indent=2)
@@ -414,8 +851,366 @@ def create_download_link(data: Dict, filename: str) -> str:
     return f'<a href="data:application/json;base64,{b64}" download="{filename}">📥 Download Results (JSON)</a>'
 
 
+# ==================== PROFILING ====================
+
+@st.cache_resource(show_spinner=False)
+def _profile_lock() -> threading.Lock:
+    """Process-wide lock: torch's profiler and cProfile (sys.monitoring on
+    Python 3.12+) allow only one active capture per process"""
+    return threading.Lock()
+
+
+class RunProfiler:
+    """Capture cProfile, stack samples and a torch trace for one run
+
+    Stack sampling runs on a background thread at PROFILE_SAMPLE_INTERVAL and
+    stops after PROFILE_MAX_SAMPLES, so its overhead and memory are bounded.
+    Only one run per process is profiled at a time; a run that finds the
+    profiler busy (or fails to start it) proceeds unprofiled.
+    Artifacts are written to PROFILE_DIR/<image hash>_<stage>_<timestamp>/
+    and bundled into profile.zip.
+    """
+    
+    def __init__(self, stage: str, image_hash: str, params: Dict):
+        self.stage = stage
+        self.image_hash = image_hash
+        self.params = params
+        self.archive = None
+        self.skipped_reason = None
+        self._lock = None
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread_id = None
+        self._sampler = None
+        self._cprofile = None
+        self._torch_profile = None
+    
+    def _sample(self):
+        num_samples = 0
+        while not self._stop.wait(Config.PROFILE_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            self._stacks[';'.join(reversed(stack))] += 1
+            num_samples += 1
+            if num_samples >= Config.PROFILE_MAX_SAMPLES:
+                break
+    
+    def _teardown(self):
+        """Stop whatever was started, in reverse order, and release the lock"""
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._torch_profile is not None:
+            self._torch_profile.__exit__(None, None, None)
+    
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+    
+    def __enter__(self) -> 'RunProfiler':
+        lock = _profile_lock()
+        if not lock.acquire(blocking=False):
+            self.skipped_reason = "another run is being profiled"
+            return self
+        self._lock = lock
+        
+        try:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            torch_profile = torch.profiler.profile(activities=activities)
+            torch_profile.__enter__()
+            self._torch_profile = torch_profile
+            
+            cprofile = cProfile.Profile()
+            cprofile.enable()
+            self._cprofile = cprofile
+            
+            # Sampler last: nothing after it can fail and leave it running
+            self._start_time = time.perf_counter()
+            self._thread_id = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        except Exception as e:
+            self._teardown()
+            self._release()
+            self._cprofile = self._torch_profile = self._sampler = None
+            self.skipped_reason = f"profiler failed to start: {e}"
+            logger.warning("Profiling disabled for this run: %s", e)
+        return self
+    
+    def __exit__(self, *exc):
+        if self._lock is None:
+            return False
+        
+        self._teardown()
+        elapsed = time.perf_counter() - self._start_time
+        
+        try:
+            self._save(elapsed)
+            prune_profiles(keep=self.archive.parent)
+        except Exception as e:
+            logger.warning("Failed to save profile: %s", e)
+            self.skipped_reason = f"saving failed: {e}"
+        finally:
+            self._release()
+        
+        # Artifacts are on disk; release the in-memory profiles
+        self._cprofile = None
+        self._torch_profile = None
+        self._stacks.clear()
+        return False
+    
+    def _save(self, elapsed: float):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        Config.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        # Unique even for repeated runs of one image within the same second
+        out_dir = Path(tempfile.mkdtemp(prefix=f"{self.image_hash[:12]}_{self.stage}_{stamp}_",
+                                        dir=Config.PROFILE_DIR))
+        
+        pstats.Stats(self._cprofile).dump_stats(str(out_dir / "profile.pstats"))
+        
+        (out_dir / "stacks.collapsed").write_text(
+            ''.join(f"{stack} {count}\n" for stack, count in self._stacks.most_common()))
+        
+        self._torch_profile.export_chrome_trace(str(out_dir / "torch_trace.json"))
+        
+        (out_dir / "meta.json").write_text(json.dumps({
+            'stage': self.stage,
+            'image_sha256': self.image_hash,
+            'parameters': self.params,
+            'elapsed_s': elapsed,
+            'stack_samples': sum(self._stacks.values()),
+            'sample_interval_s': Config.PROFILE_SAMPLE_INTERVAL,
+        }, indent=2))
+        
+        archive = out_dir / "profile.zip"
+        with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for name in ("profile.pstats", "stacks.collapsed", "torch_trace.json", "meta.json"):
+                zf.write(out_dir / name, arcname=f"{out_dir.name}/{name}")
+        self.archive = archive
+
+
+def prune_profiles(keep: Optional[Path] = None):
+    """Delete old profile directories beyond PROFILE_KEEP_RUNS / PROFILE_MAX_TOTAL_MB
+
+    Newest directories are kept first; `keep` is never deleted.
+    """
+    if not Config.PROFILE_DIR.is_dir():
+        return
+    
+    runs = sorted((d for d in Config.PROFILE_DIR.iterdir() if d.is_dir()),
+                  key=lambda d: d.stat().st_mtime, reverse=True)
+    budget = Config.PROFILE_MAX_TOTAL_MB * 2**20
+    total = 0
+    for index, run_dir in enumerate(runs):
+        total += sum(f.stat().st_size for f in run_dir.iterdir() if f.is_file())
+        if run_dir != keep and (index >= Config.PROFILE_KEEP_RUNS or total > budget):
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def profile_run(stage: str, image_hash: str, params: Dict):
+    """RunProfiler when profiling is enabled for this session, else a no-op"""
+    if not st.session_state.get('profiling_enabled', False):
+        return contextlib.nullcontext()
+    
+    profiler = RunProfiler(stage, image_hash, params)
+    runs = st.session_state.setdefault('profile_runs', [])
+    runs.append(profiler)
+    del runs[:-4]
+    return profiler
+
+
+def _request_profile_download(archive: Path):
+    """Button callback: load this archive for download on the next run"""
+    st.session_state['profile_download'] = str(archive)
+
+
+def render_profile_downloads(profiler):
+    """Download control for one captured profile
+
+    The archive is only read after the user asks for it, so reruns do not
+    load multi-MB traces, and a cleaned-up profile directory is reported
+    instead of breaking the page.
+    """
+    if not isinstance(profiler, RunProfiler):
+        return
+    if profiler.skipped_reason:
+        st.caption(f"🔬 {profiler.stage}: not profiled ({profiler.skipped_reason})")
+        return
+    if profiler.archive is None:
+        return
+    
+    archive = profiler.archive
+    if not archive.exists():
+        st.caption(f"🔬 {profiler.stage}: profile {archive.parent.name} no longer on disk")
+        return
+    
+    if st.session_state.get('profile_download') == str(archive):
+        try:
+            data = archive.read_bytes()
+        except OSError as e:
+            st.caption(f"🔬 {profiler.stage}: could not read profile ({e})")
+            return
+        st.download_button(
+            f"📥 {profiler.stage} profile ({len(data) / 2**20:.1f} MB)",
+            data=data,
+            file_name=f"{archive.parent.name}.zip",
+            mime="application/zip",
+            key=f"profile_download_{archive.parent.name}"
+        )
+    else:
+        st.button(
+            f"📦 Prepare {profiler.stage} profile",
+            on_click=_request_profile_download, args=(archive,),
+            key=f"profile_prepare_{archive.parent.name}"
+        )
+
+
 # ==================== MAIN APP ====================
 
+def run_analysis(image: np.ndarray, latitude: float, longitude: float,
+                 camera_alt: float, runoff_coeff: float, models_future: Future):
+    """Run the Calculate flow and store its results in session state"""
+    # Validation
+    if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+        st.error("❌ Invalid coordinates. Check latitude and longitude.")
+        return
+    
+    # Store in session state
+    st.session_state['image'] = image
+    st.session_state['latitude'] = latitude
+    st.session_state['longitude'] = longitude
+    st.session_state['camera_alt'] = camera_alt
+    
+    # Start the precipitation lookup now that the coordinates are
+    # confirmed; it only depends on lat/lon and overlaps inference
+    precip_messages = []
+    precip_future = submit_stage(
+        'network', fetch_precipitation, latitude, longitude,
+        lambda level, message: precip_messages.append((level, message))
+    )
+    
+    # Calculate scale
+    image_height = image.shape[0]
+    meters_per_pixel = camera_alt / image_height
+    
+    st.session_state['meters_per_pixel'] = meters_per_pixel
+    st.session_state['image_height'] = image_height
+    
+    # Downscale once up front; areas stay in m² via the corrected scale
+    preset = Config.PROCESSING_PRESET
+    proc_image, proc_scale = resize_for_processing(image, Config.PROCESSING_PRESETS[preset])
+    proc_meters_per_pixel = meters_per_pixel / proc_scale
+    
+    st.session_state['processing_preset'] = preset
+    st.session_state['processing_scale'] = proc_scale
+    st.session_state['processing_meters_per_pixel'] = proc_meters_per_pixel
+    st.session_state['processing_height'] = proc_image.shape[0]
+    
+    # Join the background model load
+    with st.spinner("🔧 Loading AI models..."):
+        yolo_model, sam_predictor = models_future.result()
+    
+    if yolo_model is None or sam_predictor is None:
+        st.error("❌ Models not loaded. Check installation.")
+        return
+    
+    # Detect roofs, streaming each result as it is segmented.
+    # Clicking Cancel triggers a rerun, which stops this loop.
+    st.session_state['segmentation_cancelled'] = False
+    st.session_state['partial_roofs'] = []
+    st.button("⏹️ Cancel", on_click=_cancel_segmentation)
+    progress_bar = st.progress(0.0, text="🏠 Detecting roofs...")
+    area_placeholder = st.empty()
+    overlay_placeholder = st.empty()
+    
+    roofs = []
+    overlay = proc_image.copy()
+    shown_roofs = 0
+    last_refresh = 0.0
+    # Closing the generator releases the SAM lock if a cancel or rerun stops us early
+    segments = iter_roof_segments(proc_image, yolo_model, sam_predictor, proc_meters_per_pixel)
+    with contextlib.closing(segments) as events:
+        for event in events:
+            total = event['total']
+            if 'triage' in event:
+                triage = event['triage']
+                st.session_state['triage'] = triage
+                st.caption(
+                    f"🔎 {triage['detected']} boxes detected, {triage['kept']} sent to SAM "
+                    f"(skipped {triage['class']} by class, {triage['area']} too small, "
+                    f"{triage['classifier']} by classifier)"
+                )
+            if total:
+                progress_bar.progress(
+                    event['done'] / total,
+                    text=f"🏠 Segmenting roofs... {event['done']}/{total}"
+                )
+            if event['roof'] is None:
+                continue
+    
+            roofs.append(event['roof'])
+            st.session_state['partial_roofs'] = roofs
+            overlay = apply_roof_overlay(overlay, event['roof'],
+                                         event['mask'], event['color'])
+            area_placeholder.metric(
+                "Roof Area So Far",
+                f"{sum(r['area_m2'] for r in roofs):,.1f} m²",
+                f"{len(roofs)} roofs"
+            )
+            now = time.perf_counter()
+            if now - last_refresh >= Config.OVERLAY_REFRESH_INTERVAL:
+                overlay_placeholder.image(cv2.cvtColor(overlay, cv2.COLOR_BGR2RGB),
+                                          use_container_width=True)
+                shown_roofs = len(roofs)
+                last_refresh = now
+    
+    # Final frame, if the last roofs arrived within the refresh interval
+    if len(roofs) > shown_roofs:
+        overlay_placeholder.image(cv2.cvtColor(overlay, cv2.COLOR_BGR2RGB),
+                                  use_container_width=True)
+    progress_bar.empty()
+    
+    if not roofs:
+        st.warning("⚠️ No roofs detected. Try adjusting detection threshold.")
+        return
+    
+    st.session_state['roofs'] = roofs
+    st.session_state['overlay'] = overlay
+    
+    total_area_m2 = sum(r['area_m2'] for r in roofs)
+    st.session_state['total_area_m2'] = total_area_m2
+    
+    # Join the background precipitation lookup
+    with st.spinner("🌧️ Fetching precipitation data..."):
+        precip_mm, api_data = precip_future.result()
+    for level, message in precip_messages:
+        _st_notify(level, message)
+    
+    if precip_mm is None:
+        st.error("❌ Failed to fetch precipitation data. Check internet connection.")
+        return
+    
+    st.session_state['precip_mm'] = precip_mm
+    
+    # Calculate harvestable water
+    results = calculate_harvestable_water(total_area_m2, precip_mm, runoff_coeff,
+                                          api_data.get('statistics'))
+    st.session_state['results'] = results
+    
+    # Success message
+    st.balloons()
+    st.success("✅ Analysis complete! Check the 'Results' tab.")
+
+
 def main():
     # Header
     st.markdown('<h1 class="main-header">💧 JalRakshak</h1>', unsafe_allow_html=True)
@@ -449,6 +1244,29 @@ def main():
                                    Config.MIN_ROOF_AREA, 5.0)
         Config.MIN_ROOF_AREA = min_area
         
+        preset = st.selectbox(
+            "Processing Resolution",
+            list(Config.PROCESSING_PRESETS),
+            index=list(Config.PROCESSING_PRESETS).index(Config.PROCESSING_PRESET),
+            help="fast: 640 px, balanced: 1280 px, full: native resolution. "
+                 "Areas are corrected for the downscale."
+        )
+        Config.PROCESSING_PRESET = preset
+        
+        profile_default = Config.PROFILE_DEFAULT or st.query_params.get('profile') in ('1', 'true')
+        st.session_state['profiling_enabled'] = st.toggle(
+            "Profiling Mode", value=profile_default,
+            help="Capture cProfile, sampled stacks and a torch trace for OCR and analysis. "
+                 "cProfile and the stack sampler only see the script thread; model loading "
+                 "and the precipitation lookup run on background threads and are not included."
+        )
+        
+        profile_runs = [p for p in st.session_state.get('profile_runs', []) if p.archive]
+        if profile_runs:
+            with st.expander("🔬 Profiles"):
+                for profiler in profile_runs[-2:]:
+                    render_profile_downloads(profiler)
+        
         st.divider()
         
         # Instructions
@@ -489,6 +1307,10 @@ def main():
             # Load image
             file_bytes = np.asarray(bytearray(uploaded_file.read()), dtype=np.uint8)
             image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+            image_hash = hashlib.sha256(file_bytes.tobytes()).hexdigest()
+            
+            # Load models in the background while OCR runs (cached after first load)
+            models_future = submit_stage('models', load_models)
             
             # Display uploaded image
             col1, col2 = st.columns([2, 1])
@@ -511,7 +1333,14 @@ def main():
             
             # Try OCR first
             if TESSERACT_AVAILABLE:
-                with st.spinner("🔍 Trying to extract coordinates via OCR..."):
+                # OCR reruns on every interaction; profile it once per image
+                ocr_profile = contextlib.nullcontext()
+                if st.session_state.get('profiled_ocr_hash') != image_hash:
+                    ocr_profile = profile_run('ocr', image_hash, {})
+                    if isinstance(ocr_profile, RunProfiler):
+                        st.session_state['profiled_ocr_hash'] = image_hash
+                
+                with st.spinner("🔍 Trying to extract coordinates via OCR..."), ocr_profile:
                     lat_ocr, lon_ocr, alt_ocr, ocr_text = extract_coordinates_ocr(image)
                 
                 if lat_ocr and lon_ocr and alt_ocr:
@@ -556,67 +1385,28 @@ def main():
             # Calculate button
             st.subheader("3️⃣ Run Analysis")
             
+            if st.session_state.pop('segmentation_cancelled', False):
+                partial = st.session_state.pop('partial_roofs', [])
+                st.warning(f"⏹️ Analysis cancelled after {len(partial)} roofs.")
+            
             if st.button("🚀 Calculate Harvest Potential", type="primary"):
-                
-                # Validation
-                if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
-                    st.error("❌ Invalid coordinates. Check latitude and longitude.")
-                    return
-                
-                # Store in session state
-                st.session_state['image'] = image
-                st.session_state['latitude'] = latitude
-                st.session_state['longitude'] = longitude
-                st.session_state['camera_alt'] = camera_alt
-                
-                # Calculate scale
-                image_height = image.shape[0]
-                meters_per_pixel = camera_alt / image_height
-                
-                st.session_state['meters_per_pixel'] = meters_per_pixel
-                st.session_state['image_height'] = image_height
-                
-                # Load models
-                with st.spinner("🔧 Loading AI models..."):
-                    yolo_model, sam_predictor = load_models()
-                
-                if yolo_model is None or sam_predictor is None:
-                    st.error("❌ Models not loaded. Check installation.")
-                    return
-                
-                # Detect roofs
-                with st.spinner("🏠 Detecting roofs..."):
-                    roofs, overlay = detect_and_segment_roofs(
-                        image, yolo_model, sam_predictor, meters_per_pixel
-                    )
-                
-                if not roofs:
-                    st.warning("⚠️ No roofs detected. Try adjusting detection threshold.")
-                    return
-                
-                st.session_state['roofs'] = roofs
-                st.session_state['overlay'] = overlay
-                
-                total_area_m2 = sum(r['area_m2'] for r in roofs)
-                st.session_state['total_area_m2'] = total_area_m2
-                
-                # Fetch precipitation
-                with st.spinner("🌧️ Fetching precipitation data..."):
-                    precip_mm, api_data = fetch_precipitation(latitude, longitude)
-                
-                if precip_mm is None:
-                    st.error("❌ Failed to fetch precipitation data. Check internet connection.")
-                    return
-                
-                st.session_state['precip_mm'] = precip_mm
-                
-                # Calculate harvestable water
-                results = calculate_harvestable_water(total_area_m2, precip_mm, runoff_coeff)
-                st.session_state['results'] = results
-                
-                # Success message
-                st.balloons()
-                st.success("✅ Analysis complete! Check the 'Results' tab.")
+                analysis_params = {
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    'camera_alt': camera_alt,
+                    'yolo_confidence': Config.YOLO_CONF_THRESHOLD,
+                    'runoff_coefficient': runoff_coeff,
+                    'min_roof_area_m2': Config.MIN_ROOF_AREA,
+                    'processing_preset': Config.PROCESSING_PRESET
+                }
+                analysis_profile = profile_run('analysis', image_hash, analysis_params)
+                try:
+                    with analysis_profile:
+                        run_analysis(image, latitude, longitude, camera_alt,
+                                     runoff_coeff, models_future)
+                finally:
+                    # Also shown for runs that stopped early, the ones most worth inspecting
+                    render_profile_downloads(analysis_profile)
     
     with tab2:
         if 'results' in st.session_state:
@@ -705,6 +1495,35 @@ def main():
                     help="Percentage of rainfall captured"
                 )
             
+            if 'dependable_75_liters' in results:
+                st.divider()
+                
+                # Reliability across years
+                st.subheader(f"📅 Reliable Yield ({results['rainfall_years']} years of data)")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric(
+                        "Dependable Yield (75% of years)",
+                        f"{results['dependable_75_liters']:,.0f} L",
+                        help=f"Rainfall of at least {results['dependable_75_precip_mm']:,.0f} mm "
+                             "was reached in 3 out of 4 years"
+                    )
+                with col2:
+                    st.metric(
+                        "Dependable Yield (90% of years)",
+                        f"{results['dependable_90_liters']:,.0f} L",
+                        help=f"Rainfall of at least {results['dependable_90_precip_mm']:,.0f} mm "
+                             "was reached in 9 out of 10 years"
+                    )
+                
+                months = ['01 Jan', '02 Feb', '03 Mar', '04 Apr', '05 May', '06 Jun',
+                          '07 Jul', '08 Aug', '09 Sep', '10 Oct', '11 Nov', '12 Dec']
+                st.bar_chart(
+                    {'Month': months, 'Liters': results['monthly_harvest_liters']},
+                    x='Month', y='Liters'
+                )
+            
             st.divider()
             
             # Download results
@@ -716,16 +1535,23 @@ def main():
                     'longitude': longitude,
                     'camera_altitude_m': st.session_state['camera_alt']
                 },
+                # Roof bbox/pixels are in processing-resolution coordinates,
+                # so meters_per_pixel here is the processing scale
                 'scale': {
-                    'meters_per_pixel': st.session_state['meters_per_pixel'],
-                    'image_height_px': st.session_state['image_height']
+                    'meters_per_pixel': st.session_state['processing_meters_per_pixel'],
+                    'image_height_px': st.session_state['processing_height'],
+                    'processing_scale': st.session_state['processing_scale'],
+                    'native_meters_per_pixel': st.session_state['meters_per_pixel'],
+                    'native_image_height_px': st.session_state['image_height']
                 },
                 'roofs': roofs,
+                'box_triage': st.session_state.get('triage'),
                 'water_harvest': results,
                 'configuration': {
                     'runoff_coefficient': Config.RUNOFF_COEFFICIENT,
                     'min_roof_area_m2': Config.MIN_ROOF_AREA,
-                    'yolo_confidence': Config.YOLO_CONF_THRESHOLD
+                    'yolo_confidence': Config.YOLO_CONF_THRESHOLD,
+                    'processing_preset': st.session_state['processing_preset']
                 }
             }
             
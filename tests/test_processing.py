@@ -0,0 +1,47 @@
+"""Tests for processing-resolution rescaling"""
+
+import numpy as np
+import pytest
+
+for module in ('streamlit', 'cv2', 'torch', 'requests'):
+    pytest.importorskip(module)
+
+import cv2
+
+import ml
+
+
+def test_small_image_is_not_resized():
+    image = np.zeros((600, 800, 3), dtype=np.uint8)
+    resized, scale = ml.resize_for_processing(image, 1280)
+    assert resized is image
+    assert scale == 1.0
+
+
+def test_full_preset_keeps_native_resolution():
+    image = np.zeros((2000, 3000, 3), dtype=np.uint8)
+    resized, scale = ml.resize_for_processing(image, ml.Config.PROCESSING_PRESETS['full'])
+    assert resized.shape == image.shape
+    assert scale == 1.0
+
+
+def test_longest_side_is_bounded():
+    image = np.zeros((900, 1600, 3), dtype=np.uint8)
+    resized, scale = ml.resize_for_processing(image, 640)
+    assert resized.shape == (360, 640, 3)
+    assert scale == pytest.approx(360 / 900)
+
+
+@pytest.mark.parametrize('max_side', [1280, 640, 320])
+def test_area_is_preserved_under_scale(max_side):
+    height, width = 1080, 1920
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.rectangle(image, (400, 300), (799, 599), (255, 255, 255), -1)
+    meters_per_pixel = 232.0 / height
+    native_area = 400 * 300 * meters_per_pixel ** 2
+
+    resized, scale = ml.resize_for_processing(image, max_side)
+    mask = resized[:, :, 0] > 127
+    area = mask.sum() * (meters_per_pixel / scale) ** 2
+
+    assert area == pytest.approx(native_area, rel=0.02)
@@ -0,0 +1,127 @@
+"""Tests for multi-year rainfall retrieval, caching and statistics"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+for module in ('streamlit', 'cv2', 'torch', 'requests'):
+    pytest.importorskip(module)
+
+import ml
+from ml import Config
+from loadtest import FakeOpenMeteo
+
+
+@pytest.fixture
+def fake_api(tmp_path, monkeypatch):
+    fake = FakeOpenMeteo().start()
+    monkeypatch.setattr(Config, 'OPEN_METEO_ARCHIVE_URL', f"{fake.base_url}/archive")
+    monkeypatch.setattr(Config, 'RAINFALL_CACHE_DIR', tmp_path)
+    monkeypatch.setattr(Config, 'API_TIMEOUT', 5)
+    yield fake
+    fake.stop()
+
+
+def test_year_chunks_split_at_year_boundaries():
+    chunks = ml._year_chunks(date(2022, 6, 1), date(2024, 2, 10))
+    assert chunks == [
+        (date(2022, 6, 1), date(2022, 12, 31)),
+        (date(2023, 1, 1), date(2023, 12, 31)),
+        (date(2024, 1, 1), date(2024, 2, 10)),
+    ]
+
+
+def test_rainfall_statistics_uses_complete_years_only():
+    dates = np.arange(np.datetime64('2021-01-01'), np.datetime64('2023-03-01'))
+    year = dates.astype('datetime64[Y]').astype(int) + 1970
+    precip = np.where(year == 2021, 1.0, 2.0).astype(np.float32)
+
+    stats = ml.rainfall_statistics(dates, precip)
+
+    assert stats['years'] == [2021, 2022]
+    assert stats['annual_totals_mm'] == [365.0, 730.0]
+    assert stats['mean_annual_mm'] == pytest.approx(547.5)
+    assert stats['dependable_75_mm'] == pytest.approx(365.0 + 0.25 * 365.0)
+    assert stats['dependable_90_mm'] == pytest.approx(365.0 + 0.10 * 365.0)
+    assert stats['monthly_mean_mm'][0] == pytest.approx(31 * 1.5)
+
+
+def test_rainfall_statistics_without_complete_year():
+    dates = np.arange(np.datetime64('2024-01-01'), np.datetime64('2024-03-01'))
+    assert ml.rainfall_statistics(dates, np.ones(len(dates), dtype=np.float32)) is None
+
+
+def test_history_is_fetched_incrementally(fake_api):
+    dates, precip, errors = ml.fetch_rainfall_history(28.7, 77.1, years=3)
+    assert not errors
+    assert fake_api.requests == 4  # Three full years plus the current one
+    assert dates[0] == np.datetime64(date(dates[-1].item().year - 3, 1, 1))
+    assert not np.isnan(precip).any()
+
+    ml.fetch_rainfall_history(28.7, 77.1, years=3)
+    assert fake_api.requests == 4
+
+    ml.fetch_rainfall_history(28.7, 77.1, years=5)
+    assert fake_api.requests == 6  # Only the two older years
+
+
+def _fail_years(monkeypatch, failing_years):
+    """Make archive requests for the given calendar years raise ConnectionError"""
+    fetch_chunk = ml.fetch_archive_chunk
+
+    def flaky_fetch(lat, lon, start_date, chunk_end):
+        if start_date.year in failing_years:
+            raise ml.requests.exceptions.ConnectionError("injected")
+        return fetch_chunk(lat, lon, start_date, chunk_end)
+
+    monkeypatch.setattr(ml, 'fetch_archive_chunk', flaky_fetch)
+    return fetch_chunk
+
+
+def test_successful_chunks_are_cached_when_one_fails(fake_api, monkeypatch):
+    end_date = date.today() - timedelta(days=Config.ARCHIVE_LAG_DAYS)
+    failing_year = end_date.year - 2
+    fetch_chunk = _fail_years(monkeypatch, {failing_year})
+
+    dates, _, errors = ml.fetch_rainfall_history(28.7, 77.1, years=3)
+    assert len(errors) == 1
+    assert isinstance(errors[0], ml.requests.exceptions.ConnectionError)
+    assert fake_api.requests == 3
+    returned_years = set((dates.astype('datetime64[Y]').astype(int) + 1970).tolist())
+    assert failing_year not in returned_years
+
+    cached, _ = ml.load_rainfall_cache(28.7, 77.1)
+    cached_years = set((cached.astype('datetime64[Y]').astype(int) + 1970).tolist())
+    assert failing_year not in cached_years
+    assert len(cached_years) == 3
+
+    monkeypatch.setattr(ml, 'fetch_archive_chunk', fetch_chunk)
+    dates, _, errors = ml.fetch_rainfall_history(28.7, 77.1, years=3)
+    assert not errors
+    assert fake_api.requests == 4  # Only the failed year is fetched again
+    assert len(dates) == (end_date - date(end_date.year - 3, 1, 1)).days + 1
+
+
+def test_precipitation_uses_complete_years_when_a_chunk_fails(fake_api, monkeypatch):
+    end_date = date.today() - timedelta(days=Config.ARCHIVE_LAG_DAYS)
+    _fail_years(monkeypatch, {end_date.year - 2})
+    messages = []
+
+    precip_mm, api_data = ml.fetch_precipitation(
+        28.7, 77.1, lambda level, message: messages.append(level))
+
+    assert api_data['source'] == 'archive'
+    assert len(api_data['statistics']['years']) == Config.RAINFALL_YEARS - 1
+    assert precip_mm == api_data['statistics']['mean_annual_mm']
+    assert 'warning' in messages
+
+
+def test_precipitation_falls_back_without_complete_years(fake_api, monkeypatch):
+    end_date = date.today() - timedelta(days=Config.ARCHIVE_LAG_DAYS)
+    _fail_years(monkeypatch, set(range(end_date.year - Config.RAINFALL_YEARS, end_date.year)))
+    monkeypatch.setattr(Config, 'OPEN_METEO_FORECAST_URL', f"{fake_api.base_url}/forecast")
+
+    _, api_data = ml.fetch_precipitation(28.7, 77.1, lambda level, message: None)
+
+    assert api_data.get('source') != 'archive'
@@ -0,0 +1,113 @@
+"""Tests for YOLO box triage before SAM"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+for module in ('streamlit', 'cv2', 'torch', 'requests'):
+    pytest.importorskip(module)
+
+import torch
+
+import ml
+from ml import Config
+
+COCO_NAMES = {0: 'person', 2: 'car', 59: 'bed', 60: 'dining table'}
+COCO_NAMES.update({i: f'class {i}' for i in range(80) if i not in COCO_NAMES})
+
+
+def make_results(boxes, class_ids, names=COCO_NAMES):
+    """Stand-in for an ultralytics Results object"""
+    return SimpleNamespace(
+        boxes=SimpleNamespace(xyxy=torch.tensor(boxes, dtype=torch.float32),
+                              cls=torch.tensor(class_ids, dtype=torch.float32)),
+        names=names,
+    )
+
+
+class ConstantClassifier(torch.nn.Module):
+    """Roof logits per patch, taken in order from `logits`"""
+
+    def __init__(self, logits):
+        super().__init__()
+        self.logits = torch.tensor(logits)
+
+    def forward(self, batch):
+        return self.logits[:len(batch)].unsqueeze(1)
+
+
+class BrokenClassifier(torch.nn.Module):
+    def forward(self, batch):
+        raise RuntimeError("bad weights")
+
+
+@pytest.fixture
+def rgb():
+    return np.zeros((200, 300, 3), dtype=np.uint8)
+
+
+@pytest.fixture(autouse=True)
+def no_classifier(monkeypatch):
+    monkeypatch.setattr(ml, 'load_patch_classifier', lambda: None)
+    monkeypatch.setattr(Config, 'MIN_ROOF_AREA', 20.0)
+
+
+def test_coco_non_roof_classes_are_dropped(rgb):
+    results = make_results([[0, 0, 100, 100], [0, 0, 100, 100], [0, 0, 100, 100]],
+                           [0, 2, 59])
+    boxes, counts = ml.triage_boxes(rgb, results, meters_per_pixel=1.0)
+
+    assert counts == {'detected': 3, 'class': 2, 'area': 0, 'classifier': 0, 'kept': 1}
+    assert boxes.tolist() == [[0, 0, 100, 100]]
+
+
+def test_custom_weights_are_unfiltered_without_allow_list(rgb):
+    results = make_results([[0, 0, 100, 100], [0, 0, 100, 100]], [0, 1],
+                           names={0: 'person', 1: 'roof'})
+    _, counts = ml.triage_boxes(rgb, results, meters_per_pixel=1.0)
+    assert counts['class'] == 0
+    assert counts['kept'] == 2
+
+
+def test_allow_list_takes_precedence(rgb, monkeypatch):
+    monkeypatch.setattr(Config, 'ROOF_CLASS_NAMES', {'roof'})
+    results = make_results([[0, 0, 100, 100], [0, 0, 100, 100]], [0, 1],
+                           names={0: 'tree', 1: 'roof'})
+    _, counts = ml.triage_boxes(rgb, results, meters_per_pixel=1.0)
+    assert counts['class'] == 1
+    assert counts['kept'] == 1
+
+
+def test_small_boxes_are_dropped_after_clipping(rgb):
+    # 4x4 m box; a 34x34 m box of which only 4x4 m lies inside the image
+    results = make_results([[0, 0, 4, 4], [296, 196, 330, 230], [0, 0, 10, 10]],
+                           [59, 59, 59])
+    _, counts = ml.triage_boxes(rgb, results, meters_per_pixel=1.0)
+    assert counts['area'] == 2
+    assert counts['kept'] == 1
+
+
+def test_class_drops_are_not_counted_as_area_drops(rgb):
+    results = make_results([[0, 0, 2, 2]], [0])
+    _, counts = ml.triage_boxes(rgb, results, meters_per_pixel=1.0)
+    assert counts['class'] == 1
+    assert counts['area'] == 0
+
+
+def test_classifier_drops_low_scoring_patches(rgb, monkeypatch):
+    monkeypatch.setattr(ml, 'load_patch_classifier', lambda: ConstantClassifier([5.0, -5.0]))
+    results = make_results([[0, 0, 100, 100], [100, 0, 200, 100], [0, 0, 2, 2]],
+                           [59, 60, 59])
+    boxes, counts = ml.triage_boxes(rgb, results, meters_per_pixel=1.0)
+
+    assert counts == {'detected': 3, 'class': 0, 'area': 1, 'classifier': 1, 'kept': 1}
+    assert boxes.tolist() == [[0, 0, 100, 100]]
+
+
+def test_failing_classifier_keeps_boxes(rgb, monkeypatch):
+    monkeypatch.setattr(ml, 'load_patch_classifier', lambda: BrokenClassifier())
+    results = make_results([[0, 0, 100, 100], [100, 0, 200, 100]], [59, 60])
+    _, counts = ml.triage_boxes(rgb, results, meters_per_pixel=1.0)
+    assert counts['classifier'] == 0
+    assert counts['kept'] == 2